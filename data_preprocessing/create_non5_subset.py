@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+非滿分子集輸出腳本
+目的：從 preprocessed_data.csv 取出 review_score 為 1-4 分的訂單，
+輸出 preprocessed_data_non5.csv（與 preprocessing.py 內建的輸出相同）。
+由 pipeline/run_pipeline.py 執行時，此步驟與 create_binary_target.py 可平行進行。
+"""
+
+import pandas as pd
+import os
+import sys
+from datetime import datetime
+
+def create_non5_subset():
+    """
+    讀取 preprocessed_data.csv 並輸出非滿分（1~4 分）子集
+    """
+    # 設定路徑
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    input_file = os.path.join(script_dir, "preprocessed_data.csv")
+    output_file = os.path.join(script_dir, "preprocessed_data_non5.csv")
+
+    print("=" * 80)
+    print("輸出非滿分（1~4 分）資料子集")
+    print("=" * 80)
+    print()
+
+    # 檢查輸入檔案是否存在
+    if not os.path.exists(input_file):
+        print(f"錯誤：找不到輸入檔案 {input_file}")
+        sys.exit(1)
+
+    # 讀取資料
+    print(f"讀取資料：{input_file}")
+    # round_trip：確保浮點數讀回後與 preprocessing.py 直接輸出的結果逐位相同
+    df = pd.read_csv(input_file, low_memory=False, float_precision='round_trip')
+    print(f"✓ 資料載入完成：{len(df):,} 筆記錄")
+    print()
+
+    # 篩選非滿分
+    non5 = df[df['review_score'] < 5].copy()
+    non5.to_csv(output_file, index=False, encoding='utf-8')
+    print(f"✓ 已輸出: {output_file} （筆數: {len(non5):,}）")
+
+    # 在控制台輸出非滿分子集比例
+    print("非滿分子集摘要（Console）：")
+    print(f"筆數: {len(non5):,}")
+    print(f"比例: {len(non5)/len(df)*100:.2f}%")
+    print(f"生成時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print()
+
+if __name__ == "__main__":
+    create_non5_subset()
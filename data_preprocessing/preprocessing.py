@@ -15,6 +15,7 @@
 # 9. 儲存清理後的資料
 # ============================================================================
 
+import argparse
 import pandas as pd
 import numpy as np
 import os
@@ -22,6 +23,11 @@ from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+parser = argparse.ArgumentParser(description='合併資料前處理')
+parser.add_argument('--no-non5', action='store_true',
+                    help='不輸出非滿分子集（由 pipeline 的 non5 stage 以 create_non5_subset.py 產生）')
+args = parser.parse_args()
+
 # ============================================================================
 # 步驟 1: 載入資料與基本檢視
 # ============================================================================
@@ -431,17 +437,19 @@ print(f"最終欄位數: {summary_report['final_variables']}")
 print(f"處理日期: {summary_report['processing_date']}")
 
 # 另存「非滿分（1~4 分）」子集，供專注分析
-print("\n輸出僅含 1~4 分（非滿分）之資料子集...")
-non5 = data[data['review_score'] < 5].copy()
-non5_file = os.path.join(script_dir, "preprocessed_data_non5.csv")
-non5.to_csv(non5_file, index=False, encoding='utf-8')
-print(f"✓ 已輸出: {non5_file} （筆數: {len(non5):,}）")
-
-# 在控制台同時輸出非滿分子集比例（不產生 txt）
-print("非滿分子集摘要（Console）：")
-print(f"筆數: {len(non5):,}")
-print(f"比例: {len(non5)/summary_report['final_rows']*100:.2f}%")
-print(f"生成時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+# （由 pipeline/run_pipeline.py 執行時加上 --no-non5，改由 create_non5_subset.py 獨立產生）
+if not args.no_non5:
+    print("\n輸出僅含 1~4 分（非滿分）之資料子集...")
+    non5 = data[data['review_score'] < 5].copy()
+    non5_file = os.path.join(script_dir, "preprocessed_data_non5.csv")
+    non5.to_csv(non5_file, index=False, encoding='utf-8')
+    print(f"✓ 已輸出: {non5_file} （筆數: {len(non5):,}）")
+
+    # 在控制台同時輸出非滿分子集比例（不產生 txt）
+    print("非滿分子集摘要（Console）：")
+    print(f"筆數: {len(non5):,}")
+    print(f"比例: {len(non5)/summary_report['final_rows']*100:.2f}%")
+    print(f"生成時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
 print("\n" + "=" * 80)
 print("資料前處理完成！")
@@ -0,0 +1,683 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+預先分箱（pre-binned）繪圖腳本
+目的：資料量達數百萬筆訂單時，逐列繪製散點圖既慢又嚴重重疊。
+本腳本先把前處理後的資料壓縮成分箱彙總（2-D 直方圖、每箱平均評分、
+GLM 預測網格），再以多個 worker process 平行輸出所有圖表；
+彙總結果沒有改變的圖表會直接略過。
+
+輸出：
+- plots/*_binned.png       （全部資料）
+- plots_non5/*_binned.png  （非滿分子集）
+- descriptive_analysis/.plot_cache/  （彙總快取與圖表 manifest）
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# 彙總邏輯或繪圖邏輯變更時請遞增，讓舊快取失效
+AGGREGATE_VERSION = 3
+RENDER_VERSION = 2
+
+# 讀取 CSV 時每批筆數（避免一次解析整個檔案）
+CHUNK_SIZE = 500_000
+
+# 分箱數
+BINS_2D = 60
+BINS_1D = 40
+# 變數關係矩陣每格的分箱數（格子小，分箱較粗）
+BINS_PAIRS = 30
+
+# 分箱範圍取分位數（去除極端值對座標軸的影響）
+RANGE_QUANTILES = (0.001, 0.999)
+
+# 需要讀入的欄位
+NUMERIC_COLUMNS = ['review_score', 'delivery_days', 'delivery_gap', 'price',
+                   'freight_value', 'product_weight_g', 'product_photos_qty',
+                   'payment_installments']
+
+# 右偏變數以 log1p 尺度分箱
+LOG_SCALE_VARS = {'price', 'freight_value', 'product_weight_g'}
+
+# 共線性檢查變數對（與 multicollinearity_scatter.R 相同）
+COLLINEARITY_PAIRS = [
+    ('delivery_days', 'delivery_gap', 'collinearity_delivery_days_vs_gap'),
+    ('product_weight_g', 'freight_value', 'collinearity_weight_vs_freight'),
+    ('price', 'freight_value', 'collinearity_price_vs_freight'),
+    ('price', 'product_weight_g', 'collinearity_price_vs_weight'),
+    ('price', 'payment_installments', 'collinearity_price_vs_installments'),
+    ('product_weight_g', 'payment_installments', 'collinearity_weight_vs_installments'),
+    ('freight_value', 'payment_installments', 'collinearity_freight_vs_installments'),
+]
+
+# 與評論分數的關係圖（與 descriptive_statistics.R 相同）
+SCORE_RELATIONS = [
+    ('delivery_gap', 'delivery_gap_vs_review_score'),
+    ('price', 'price_vs_review_score'),
+]
+
+# 變數關係矩陣（correlation_pairs_plot.png，8x8）：review_score 與 descriptive_statistics.R 的 main_vars
+PAIRS_VARS = ['review_score', 'delivery_days', 'delivery_gap', 'price', 'freight_value',
+              'product_weight_g', 'product_photos_qty', 'payment_installments']
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+cache_dir = os.path.join(script_dir, '.plot_cache')
+
+# final_model 的定義與估計方式與 model_scoring/ 共用，避免兩邊不一致
+sys.path.insert(0, os.path.join(project_root, 'model_scoring'))
+from model_artifact import (FINAL_MODEL_SPEC, TARGET_RULES, build_design_matrix,
+                            derive_features, fit_glm_artifact, logit_information)
+model_artifact_file = os.path.join(project_root, 'model_scoring', 'model_artifact.py')
+
+DATASETS = {
+    'all': {
+        'input': os.path.join(project_root, 'data_preprocessing', 'preprocessed_data.csv'),
+        'output_dir': os.path.join(project_root, 'plots'),
+        'label': 'All Data',
+        'fit_glm': True,
+    },
+    'non5': {
+        'input': os.path.join(project_root, 'data_preprocessing', 'preprocessed_data_non5.csv'),
+        'output_dir': os.path.join(project_root, 'plots_non5'),
+        'label': 'Non-5',
+        # 非滿分子集的 success 全為 0，無法估計 GLM
+        'fit_glm': False,
+    },
+}
+
+
+# ============================================================================
+# 指紋（fingerprint）
+# ============================================================================
+
+def file_digest(path, block_size=1 << 20):
+    """計算檔案內容的 SHA-256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _update_digest(h, obj):
+    """以固定順序把巢狀 dict/list/ndarray/純量寫入雜湊"""
+    if isinstance(obj, dict):
+        h.update(b'{')
+        for key in sorted(obj):
+            h.update(repr(key).encode('utf-8'))
+            _update_digest(h, obj[key])
+        h.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[')
+        for item in obj:
+            _update_digest(h, item)
+        h.update(b']')
+    elif isinstance(obj, np.ndarray):
+        h.update(str(obj.dtype).encode('utf-8'))
+        h.update(repr(obj.shape).encode('utf-8'))
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        h.update(repr(obj).encode('utf-8'))
+
+
+def object_digest(obj):
+    """計算巢狀結構的 SHA-256（用於判斷圖表輸入是否改變）"""
+    h = hashlib.sha256()
+    _update_digest(h, obj)
+    return h.hexdigest()
+
+
+# ============================================================================
+# 資料載入與分箱彙總
+# ============================================================================
+
+def load_columns(path):
+    """分批讀取需要的欄位，回傳 {欄位: float64 陣列}"""
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in NUMERIC_COLUMNS if c in header]
+    parts = {c: [] for c in usecols}
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=CHUNK_SIZE,
+                             encoding='utf-8'):
+        for c in usecols:
+            parts[c].append(pd.to_numeric(chunk[c], errors='coerce').to_numpy(dtype=float))
+    return {c: np.concatenate(v) if v else np.empty(0) for c, v in parts.items()}
+
+
+def axis_values(columns, var):
+    """回傳繪圖用的座標值（右偏變數取 log1p）"""
+    x = columns[var]
+    return np.log1p(np.clip(x, 0, None)) if var in LOG_SCALE_VARS else x
+
+
+def axis_label(var):
+    return f'{var} (log1p)' if var in LOG_SCALE_VARS else var
+
+
+def bin_edges(x, bins):
+    """以分位數範圍建立等寬分箱邊界；整數型變數對齊到整數"""
+    x = x[np.isfinite(x)]
+    if len(x) == 0:
+        return np.linspace(0, 1, bins + 1)
+    lo, hi = np.quantile(x, RANGE_QUANTILES)
+    if hi <= lo:
+        lo, hi = lo - 0.5, hi + 0.5
+    if np.all(x == np.round(x)) and hi - lo <= bins:
+        return np.arange(np.floor(lo) - 0.5, np.ceil(hi) + 1.0, 1.0)
+    return np.linspace(lo, hi, bins + 1)
+
+
+def linear_fit_stats(x, y):
+    """以充分統計量計算相關係數、R² 與 OLS 直線"""
+    mask = np.isfinite(x) & np.isfinite(y)
+    x, y = x[mask], y[mask]
+    n = len(x)
+    if n < 2:
+        return {'n': n, 'cor': np.nan, 'r_squared': np.nan,
+                'intercept': np.nan, 'slope': np.nan}
+    sx, sy = x.sum(), y.sum()
+    sxx, syy, sxy = (x * x).sum(), (y * y).sum(), (x * y).sum()
+    cov = sxy - sx * sy / n
+    var_x = sxx - sx * sx / n
+    var_y = syy - sy * sy / n
+    cor = cov / np.sqrt(var_x * var_y) if var_x > 0 and var_y > 0 else np.nan
+    slope = cov / var_x if var_x > 0 else np.nan
+    intercept = (sy - slope * sx) / n
+    return {'n': n, 'cor': float(cor), 'r_squared': float(cor ** 2),
+            'intercept': float(intercept), 'slope': float(slope)}
+
+
+def hist2d(x, y, x_edges, y_edges, weights=None):
+    mask = np.isfinite(x) & np.isfinite(y)
+    if weights is not None:
+        mask &= np.isfinite(weights)
+        weights = weights[mask]
+    counts, _, _ = np.histogram2d(x[mask], y[mask], bins=[x_edges, y_edges],
+                                  weights=weights)
+    return counts
+
+
+def binned_mean(x, y, edges):
+    """每個 x 分箱內 y 的筆數與平均"""
+    mask = np.isfinite(x) & np.isfinite(y)
+    counts, _ = np.histogram(x[mask], bins=edges)
+    sums, _ = np.histogram(x[mask], bins=edges, weights=y[mask])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    return counts, means
+
+
+def aggregate_collinearity(columns, x_var, y_var):
+    x, y = axis_values(columns, x_var), axis_values(columns, y_var)
+    x_edges, y_edges = bin_edges(x, BINS_2D), bin_edges(y, BINS_2D)
+    return {
+        'x_var': x_var, 'y_var': y_var,
+        'x_label': axis_label(x_var), 'y_label': axis_label(y_var),
+        'x_edges': x_edges, 'y_edges': y_edges,
+        'counts': hist2d(x, y, x_edges, y_edges),
+        # 相關係數沿用原始尺度，與 R 腳本一致
+        'fit_raw': linear_fit_stats(columns[x_var], columns[y_var]),
+        'fit_axis': linear_fit_stats(x, y),
+    }
+
+
+def aggregate_score_relation(columns, x_var):
+    x = axis_values(columns, x_var)
+    score = columns['review_score']
+    x_edges = bin_edges(x, BINS_2D)
+    score_edges = np.arange(0.5, 6.0, 1.0)
+    mean_edges = bin_edges(x, BINS_1D)
+    counts_1d, mean_score = binned_mean(x, score, mean_edges)
+    return {
+        'x_var': x_var, 'x_label': axis_label(x_var),
+        'x_edges': x_edges, 'score_edges': score_edges,
+        'counts': hist2d(x, score, x_edges, score_edges),
+        'mean_edges': mean_edges, 'mean_counts': counts_1d, 'mean_score': mean_score,
+        'fit': linear_fit_stats(x, score),
+    }
+
+
+def aggregate_mean_score_surface(columns):
+    """delivery_days × delivery_gap 每箱平均評分"""
+    x, y = columns['delivery_days'], columns['delivery_gap']
+    score = columns['review_score']
+    x_edges, y_edges = bin_edges(x, BINS_2D), bin_edges(y, BINS_2D)
+    counts = hist2d(x, y, x_edges, y_edges, weights=None)
+    sums = hist2d(x, y, x_edges, y_edges, weights=score)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    return {'x_edges': x_edges, 'y_edges': y_edges, 'counts': counts, 'mean_score': means}
+
+
+def aggregate_pairs(columns):
+    """變數關係矩陣：對角為 1-D 直方圖，下三角為 2-D 直方圖，上三角為相關係數"""
+    variables = [v for v in PAIRS_VARS if v in columns]
+    values = {v: axis_values(columns, v) for v in variables}
+    edges = {v: bin_edges(values[v], BINS_PAIRS) for v in variables}
+    diagonal = {}
+    for v in variables:
+        x = values[v]
+        diagonal[v], _ = np.histogram(x[np.isfinite(x)], bins=edges[v])
+    cells, cor = {}, {}
+    for i, y_var in enumerate(variables):
+        for x_var in variables[:i]:
+            cells[(x_var, y_var)] = hist2d(values[x_var], values[y_var], edges[x_var], edges[y_var])
+            # 相關係數沿用原始尺度，與 R 腳本一致
+            cor[(x_var, y_var)] = linear_fit_stats(columns[x_var], columns[y_var])['cor']
+    return {'vars': variables, 'labels': {v: axis_label(v) for v in variables},
+            'edges': edges, 'diagonal': diagonal, 'cells': cells, 'cor': cor}
+
+
+# ============================================================================
+# GLM（final_model）與預測網格
+# ============================================================================
+
+def glm_design(artifact, **values):
+    """以衍生後的變數值（純量或陣列）組成 artifact 的設計矩陣"""
+    n = max(np.size(v) for v in values.values())
+    frame = pd.DataFrame({k: np.broadcast_to(np.asarray(v, dtype=float), n) for k, v in values.items()})
+    return build_design_matrix(frame, artifact)
+
+
+def predict_logit(beta, cov, X):
+    """回傳預測機率與 95% 信賴區間（於 link 尺度計算後轉換）"""
+    eta = X @ beta
+    se = np.sqrt(np.einsum('ij,jk,ik->i', X, cov, X))
+    expit = lambda v: 1.0 / (1.0 + np.exp(-v))
+    return expit(eta), expit(eta - 1.96 * se), expit(eta + 1.96 * se)
+
+
+def aggregate_glm(columns):
+    """擬合 final_model 並預先計算 complete_analysis.R 三張 GLM 圖的預測網格"""
+    frame = pd.DataFrame({c: columns[c] for c in
+                          ['review_score', 'delivery_days', 'delivery_gap', 'price', 'freight_value']})
+    artifact = fit_glm_artifact(frame, FINAL_MODEL_SPEC)
+    beta = np.array([c['estimate'] for c in artifact['coefficients']])
+
+    data = derive_features(frame, {**artifact['derived'], 'success': TARGET_RULES['success']})
+    X = build_design_matrix(data, artifact)
+    mask = np.isfinite(X).all(axis=1) & np.isfinite(data['success'].to_numpy(dtype=float))
+    cov = np.linalg.inv(logit_information(X[mask], beta))
+
+    data = data[mask]
+    log_days = data['log_delivery_days'].to_numpy(dtype=float)
+    log_price = data['log_price'].to_numpy(dtype=float)
+    freight = data['freight_value'].to_numpy(dtype=float)
+    gap = data['delivery_gap'].to_numpy(dtype=float)
+    success = data['success'].to_numpy(dtype=float)
+
+    mean_log_days, mean_log_price = log_days.mean(), log_price.mean()
+    mean_freight, mean_gap = freight.mean(), gap.mean()
+
+    # 1) 準時 vs 延遲
+    scenarios = glm_design(artifact, log_delivery_days=mean_log_days, log_price=mean_log_price,
+                           freight_value=mean_freight, delivery_delayed=[0.0, 1.0],
+                           delivery_early=0.0, delivery_gap=[0.0, 1.0])
+    delay_prob, delay_lo, delay_hi = predict_logit(beta, cov, scenarios)
+
+    # 2) delivery_days 曲線（delivery_early = 1，其餘取平均）
+    days_grid = np.linspace(log_days.min(), log_days.max(), 100)
+    X_days = glm_design(artifact, log_delivery_days=days_grid, log_price=mean_log_price,
+                        freight_value=mean_freight, delivery_delayed=0.0,
+                        delivery_early=1.0, delivery_gap=mean_gap)
+    days_prob, days_lo, days_hi = predict_logit(beta, cov, X_days)
+    delivery_days = data['delivery_days'].to_numpy(dtype=float)
+    day_edges = bin_edges(delivery_days, BINS_1D)
+    day_counts, day_rate = binned_mean(delivery_days, success, day_edges)
+
+    # 3) freight_value × delivery_gap 交互作用
+    gap_seq = np.linspace(-20, 20, 100)
+    freight_levels = np.quantile(freight, [0.25, 0.75])
+    interaction_prob = []
+    for level in freight_levels:
+        X_int = glm_design(artifact, log_delivery_days=mean_log_days, log_price=mean_log_price,
+                           freight_value=level, delivery_delayed=(gap_seq > 0).astype(float),
+                           delivery_early=(gap_seq < 0).astype(float), delivery_gap=gap_seq)
+        interaction_prob.append(predict_logit(beta, cov, X_int)[0])
+
+    return {
+        'terms': [c['name'] for c in artifact['coefficients']], 'coefficients': beta,
+        'n': artifact['training']['n_obs'],
+        'delay': {'prob': delay_prob, 'lower': delay_lo, 'upper': delay_hi},
+        'days': {'x': np.expm1(days_grid), 'prob': days_prob, 'lower': days_lo, 'upper': days_hi,
+                 'obs_edges': day_edges, 'obs_counts': day_counts, 'obs_rate': day_rate},
+        'interaction': {'gap': gap_seq, 'freight_levels': freight_levels,
+                        'prob': np.vstack(interaction_prob)},
+    }
+
+
+def build_aggregates(columns, fit_glm):
+    """把逐列資料壓縮成所有圖表需要的分箱彙總"""
+    aggregates = {'n_rows': len(columns['review_score'])}
+    for x_var, y_var, name in COLLINEARITY_PAIRS:
+        if x_var in columns and y_var in columns:
+            aggregates[name] = aggregate_collinearity(columns, x_var, y_var)
+    for x_var, name in SCORE_RELATIONS:
+        if x_var in columns:
+            aggregates[name] = aggregate_score_relation(columns, x_var)
+    aggregates['mean_score_delivery_days_vs_gap'] = aggregate_mean_score_surface(columns)
+    aggregates['correlation_pairs_plot'] = aggregate_pairs(columns)
+    if fit_glm:
+        aggregates['glm'] = aggregate_glm(columns)
+    return aggregates
+
+
+def load_or_build_aggregates(name, spec, force=False):
+    """輸入檔案、彙總版本與（含 GLM 時）共用的模型程式都未改變時，直接讀取快取的彙總結果"""
+    digest = file_digest(spec['input'])
+    # GLM 預測網格依賴 model_artifact.py 的 FINAL_MODEL_SPEC 與 IRLS，該檔案改變時需重新估計
+    model_digest = file_digest(model_artifact_file) if spec['fit_glm'] else None
+    cache_file = os.path.join(cache_dir, f'aggregates_{name}.pkl')
+    if not force and os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            cached = pickle.load(f)
+        if (cached.get('input_digest') == digest and cached.get('version') == AGGREGATE_VERSION
+                and cached.get('model_digest') == model_digest):
+            print(f"  ✓ {name}: 輸入未改變，使用快取的分箱彙總")
+            return cached['aggregates']
+
+    print(f"  - {name}: 讀取 {spec['input']}")
+    columns = load_columns(spec['input'])
+    print(f"    筆數: {len(columns['review_score']):,}，建立分箱彙總...")
+    aggregates = build_aggregates(columns, spec['fit_glm'])
+    with open(cache_file, 'wb') as f:
+        pickle.dump({'input_digest': digest, 'version': AGGREGATE_VERSION,
+                     'model_digest': model_digest, 'aggregates': aggregates}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"  ✓ {name}: 分箱彙總完成並寫入快取")
+    return aggregates
+
+
+# ============================================================================
+# 繪圖（在 worker process 中執行）
+# ============================================================================
+
+def _pcolormesh_counts(ax, x_edges, y_edges, counts):
+    from matplotlib.colors import LogNorm
+    masked = np.ma.masked_where(counts.T <= 0, counts.T)
+    vmax = max(float(counts.max()), 1.0)
+    return ax.pcolormesh(x_edges, y_edges, masked, cmap='Blues',
+                         norm=LogNorm(vmin=1, vmax=vmax), shading='flat')
+
+
+def render_collinearity(fig, agg, label):
+    ax = fig.add_subplot(111)
+    mesh = _pcolormesh_counts(ax, agg['x_edges'], agg['y_edges'], agg['counts'])
+    fig.colorbar(mesh, ax=ax, label='Count (log scale)')
+    fit = agg['fit_axis']
+    xs = np.array([agg['x_edges'][0], agg['x_edges'][-1]])
+    ax.plot(xs, fit['intercept'] + fit['slope'] * xs, color='red', lw=2)
+    ax.set_ylim(agg['y_edges'][0], agg['y_edges'][-1])
+    cor = agg['fit_raw']['cor']
+    level = 'High' if abs(cor) > 0.7 else 'Moderate' if abs(cor) > 0.5 else 'Low'
+    ax.set_title(f"{agg['y_var']} vs {agg['x_var']} ({label})", fontweight='bold')
+    ax.text(0.5, 1.01, f"Correlation: {cor:.3f} | R²: {agg['fit_raw']['r_squared']:.3f} "
+                       f"| Collinearity: {level}",
+            transform=ax.transAxes, ha='center', va='bottom', fontsize=9, color='gray')
+    ax.set_xlabel(agg['x_label'])
+    ax.set_ylabel(agg['y_label'])
+
+
+def render_score_relation(fig, agg, label):
+    ax = fig.add_subplot(111)
+    mesh = _pcolormesh_counts(ax, agg['x_edges'], agg['score_edges'], agg['counts'])
+    fig.colorbar(mesh, ax=ax, label='Count (log scale)')
+    centers = (agg['mean_edges'][:-1] + agg['mean_edges'][1:]) / 2
+    ax.plot(centers, agg['mean_score'], color='orange', lw=2, marker='o', ms=3,
+            label='Mean score per bin')
+    fit = agg['fit']
+    xs = np.array([agg['x_edges'][0], agg['x_edges'][-1]])
+    ax.plot(xs, fit['intercept'] + fit['slope'] * xs, color='red', lw=2, label='OLS fit')
+    ax.set_ylim(0.5, 5.5)
+    ax.set_title(f"{agg['x_var']} vs Review Score ({label})", fontweight='bold')
+    ax.set_xlabel(agg['x_label'])
+    ax.set_ylabel('Review Score')
+    ax.legend(loc='lower left')
+
+
+def render_mean_score_surface(fig, agg, label):
+    ax = fig.add_subplot(111)
+    masked = np.ma.masked_invalid(agg['mean_score'].T)
+    mesh = ax.pcolormesh(agg['x_edges'], agg['y_edges'], masked, cmap='RdYlGn',
+                         vmin=1, vmax=5, shading='flat')
+    fig.colorbar(mesh, ax=ax, label='Mean review score')
+    ax.set_title(f'Mean Review Score by Delivery Days and Gap ({label})', fontweight='bold')
+    ax.set_xlabel('delivery_days')
+    ax.set_ylabel('delivery_gap')
+
+
+def render_pairs(fig, agg, label):
+    from matplotlib.colors import LogNorm
+    variables = agg['vars']
+    k = len(variables)
+    vmax = max([float(c.max()) for c in agg['cells'].values()] + [1.0])
+    for i, y_var in enumerate(variables):
+        for j, x_var in enumerate(variables):
+            ax = fig.add_subplot(k, k, i * k + j + 1)
+            ax.tick_params(labelsize=6)
+            if i == j:
+                edges = agg['edges'][x_var]
+                ax.bar(edges[:-1], agg['diagonal'][x_var], width=np.diff(edges), align='edge',
+                       color='skyblue', edgecolor='none')
+                ax.set_yticks([])
+            elif i > j:
+                counts = agg['cells'][(x_var, y_var)]
+                masked = np.ma.masked_where(counts.T <= 0, counts.T)
+                ax.pcolormesh(agg['edges'][x_var], agg['edges'][y_var], masked, cmap='Blues',
+                              norm=LogNorm(vmin=1, vmax=vmax), shading='flat')
+            else:
+                cor = agg['cor'][(y_var, x_var)]
+                ax.text(0.5, 0.5, f'{cor:.2f}', transform=ax.transAxes, ha='center', va='center',
+                        fontsize=8 + 10 * (abs(cor) if np.isfinite(cor) else 0))
+                ax.set_xticks([])
+                ax.set_yticks([])
+            if i < k - 1:
+                ax.set_xticklabels([])
+            else:
+                ax.set_xlabel(agg['labels'][x_var], fontsize=7)
+            if j > 0:
+                ax.set_yticklabels([])
+            elif i > 0:
+                ax.set_ylabel(agg['labels'][y_var], fontsize=7)
+    fig.suptitle(f'Pairs Plot of Main Variables ({label})', fontweight='bold')
+
+
+def render_glm_delay(fig, agg, label):
+    ax = fig.add_subplot(111)
+    d = agg['delay']
+    prob = d['prob']
+    err = np.vstack([prob - d['lower'], d['upper'] - prob])
+    bars = ax.bar(['On-time', 'Delayed'], prob, color=['skyblue', 'salmon'], width=0.5,
+                  yerr=err, capsize=6)
+    for bar, p in zip(bars, prob):
+        ax.text(bar.get_x() + bar.get_width() / 2, p, f'{p * 100:.1f}%',
+                ha='center', va='bottom', fontsize=12)
+    ax.set_ylim(0, float(np.nanmax(d['upper'])) * 1.2)
+    ax.set_title('Influence of delay')
+    ax.set_xlabel('Status')
+    ax.set_ylabel('Probability of score of 5')
+
+
+def render_glm_days(fig, agg, label):
+    ax = fig.add_subplot(111)
+    d = agg['days']
+    ax.fill_between(d['x'], d['lower'], d['upper'], color='darkred', alpha=0.15)
+    ax.plot(d['x'], d['prob'], color='darkred', lw=2, label='final_model prediction')
+    centers = (d['obs_edges'][:-1] + d['obs_edges'][1:]) / 2
+    ax.scatter(centers, d['obs_rate'], s=12, color='gray', label='Observed rate per bin')
+    ax.set_title('Influence of delivery days')
+    ax.set_xlabel('Delivery days')
+    ax.set_ylabel('Probability of score of 5')
+    ax.legend(loc='upper right')
+
+
+def render_glm_interaction(fig, agg, label):
+    ax = fig.add_subplot(111)
+    d = agg['interaction']
+    low, high = d['freight_levels']
+    ax.plot(d['gap'], d['prob'][0], color='blue', lw=2, label=f'Low freight (${low:.2f})')
+    ax.plot(d['gap'], d['prob'][1], color='red', lw=2, label=f'High freight (${high:.2f})')
+    ax.axvline(0, ls='--', color='grey')
+    ax.set_title('Influence of interaction of freight value and delivery gap')
+    ax.set_xlabel('Delivery gap')
+    ax.set_ylabel('Probability of score of 5')
+    ax.legend(loc='lower left', frameon=False)
+
+
+RENDERERS = {
+    'collinearity': render_collinearity,
+    'score_relation': render_score_relation,
+    'mean_score_surface': render_mean_score_surface,
+    'pairs': render_pairs,
+    'glm_delay': render_glm_delay,
+    'glm_days': render_glm_days,
+    'glm_interaction': render_glm_interaction,
+}
+
+
+def render_figure(task):
+    """worker 進入點：繪製單張圖表並寫出 PNG"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=task.get('figsize', (10, 7)), dpi=100)
+    try:
+        RENDERERS[task['kind']](fig, task['payload'], task['label'])
+        fig.tight_layout()
+        fig.savefig(task['output'])
+    finally:
+        plt.close(fig)
+    return task['output']
+
+
+# ============================================================================
+# 任務排程
+# ============================================================================
+
+def plan_tasks(name, spec, aggregates):
+    """列出此資料集要輸出的所有圖表"""
+    out = spec['output_dir']
+    tasks = []
+
+    def add(kind, filename, payload, figsize=(10, 7)):
+        tasks.append({'dataset': name, 'kind': kind, 'label': spec['label'],
+                      'output': os.path.join(out, filename), 'payload': payload,
+                      'figsize': figsize})
+
+    for _, _, key in COLLINEARITY_PAIRS:
+        if key in aggregates:
+            add('collinearity', f'{key}_binned.png', aggregates[key])
+    for _, key in SCORE_RELATIONS:
+        if key in aggregates:
+            add('score_relation', f'{key}_binned.png', aggregates[key])
+    add('mean_score_surface', 'mean_score_delivery_days_vs_gap_binned.png',
+        aggregates['mean_score_delivery_days_vs_gap'])
+    add('pairs', 'correlation_pairs_plot_binned.png', aggregates['correlation_pairs_plot'],
+        figsize=(14, 14))
+    if 'glm' in aggregates:
+        glm = aggregates['glm']
+        add('glm_delay', 'glm_delivery_delay_influence_binned.png', glm)
+        add('glm_days', 'glm_delivery_days_influence_binned.png', glm)
+        add('glm_interaction', 'glm_freight_delivery_gap_interaction_binned.png', glm)
+
+    for task in tasks:
+        task['digest'] = object_digest({'kind': task['kind'], 'label': task['label'],
+                                        'payload': task['payload'], 'figsize': task['figsize'],
+                                        'version': RENDER_VERSION})
+    return tasks
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(path, manifest):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以預先分箱的彙總資料平行輸出圖表')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='平行繪圖的 worker 數（預設為 CPU 核心數）')
+    parser.add_argument('--force', action='store_true',
+                        help='忽略快取，重新彙總並重繪所有圖表')
+    parser.add_argument('--datasets', nargs='+', choices=sorted(DATASETS),
+                        default=list(DATASETS), help='要處理的資料集')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("預先分箱繪圖")
+    print("=" * 80)
+    print()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, 'plot_manifest.json')
+    manifest = load_manifest(manifest_path)
+
+    # 步驟 1: 建立（或讀取）分箱彙總
+    print("步驟 1: 建立分箱彙總")
+    tasks = []
+    for name in args.datasets:
+        spec = DATASETS[name]
+        if not os.path.exists(spec['input']):
+            print(f"  ✗ 找不到檔案: {spec['input']}（請先執行 data_preprocessing/preprocessing.py）")
+            continue
+        os.makedirs(spec['output_dir'], exist_ok=True)
+        aggregates = load_or_build_aggregates(name, spec, force=args.force)
+        tasks.extend(plan_tasks(name, spec, aggregates))
+    print()
+
+    # 步驟 2: 略過輸入未改變的圖表
+    pending = []
+    for task in tasks:
+        rel = os.path.relpath(task['output'], project_root)
+        if (not args.force and os.path.exists(task['output'])
+                and manifest.get(rel) == task['digest']):
+            continue
+        pending.append(task)
+    print(f"步驟 2: 共 {len(tasks)} 張圖表，{len(tasks) - len(pending)} 張未改變已略過，"
+          f"{len(pending)} 張需要繪製")
+    print()
+
+    # 步驟 3: 平行繪圖
+    if pending:
+        workers = max(1, min(args.workers, len(pending)))
+        print(f"步驟 3: 以 {workers} 個 worker 平行繪圖...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(render_figure, task): task for task in pending}
+            for future in as_completed(futures):
+                task = futures[future]
+                rel = os.path.relpath(task['output'], project_root)
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"  ✗ {rel}: {e}")
+                    manifest.pop(rel, None)
+                    continue
+                manifest[rel] = task['digest']
+                print(f"  ✓ {rel}")
+        save_manifest(manifest_path, manifest)
+        print()
+
+    print("=" * 80)
+    print("繪圖完成！")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+建立模型 artifact 腳本
+目的：不需開啟 R，直接以 Python 重新擬合 complete_analysis.R 中的模型並匯出 JSON：
+- final_model.json               ：success ~ log_delivery_days + log_price + freight_value +
+                                   delivery_delayed + delivery_early + freight_value:delivery_gap
+- bad_review_category_model.json ：is_bad_review ~ product_category_name_english（glm_b1）
+- bad_review_basket_model.json   ：is_bad_review ~ 訂單內所有商品類別（multi-hot 稀疏矩陣）
+                                   需先由 sql_merge/load_and_merge_data.py 產生 order_category 矩陣
+
+若已在 R 中擬合，也可用 export_model_artifact.R 匯出相同格式。
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+from model_artifact import (BAD_REVIEW_CATEGORY_SPEC, BASKET_CATEGORY_SPEC, FINAL_MODEL_SPEC,
+                            fit_glm_artifact, save_artifact)
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(script_dir)
+    data_path = os.path.join(project_root, "data_preprocessing", "preprocessed_data.csv")
+
+    print("=" * 80)
+    print("建立模型 artifact")
+    print("=" * 80)
+    print()
+
+    if not os.path.exists(data_path):
+        print(f"錯誤：找不到檔案 {data_path}")
+        print("請確認已執行 data_preprocessing/preprocessing.py！")
+        exit(1)
+
+    print(f"載入資料: {data_path}")
+    df = pd.read_csv(data_path, encoding='utf-8', low_memory=False)
+    print(f"✓ 資料載入完成：{len(df):,} 筆記錄\n")
+
+    outputs = [
+        (FINAL_MODEL_SPEC, 'final_model.json', None),
+        (BAD_REVIEW_CATEGORY_SPEC, 'bad_review_category_model.json', None),
+    ]
+
+    # 稀疏矩陣：列依前處理後資料的 order_id 重新對齊
+    sql_merge_dir = os.path.join(project_root, "sql_merge")
+    sys.path.insert(0, sql_merge_dir)
+    from sparse_relations import load_relation, matrix_path
+
+    relation = BASKET_CATEGORY_SPEC['sparse_features']['basket_categories']['relation']
+    if os.path.exists(matrix_path(relation, sql_merge_dir)):
+        matrix, vocab = load_relation(relation, order_ids=df['order_id'], directory=sql_merge_dir)
+        print(f"✓ 載入稀疏矩陣 {relation}: {matrix.shape[0]:,} × {matrix.shape[1]:,}，"
+              f"非零元素 {matrix.nnz:,}\n")
+        outputs.append((BASKET_CATEGORY_SPEC, 'bad_review_basket_model.json',
+                        {'basket_categories': (matrix, vocab)}))
+    else:
+        print(f"注意：找不到 {matrix_path(relation, sql_merge_dir)}，略過 {BASKET_CATEGORY_SPEC['name']}")
+        print("請重新執行 sql_merge/load_and_merge_data.py 產生稀疏矩陣\n")
+
+    for spec, filename, sparse_inputs in outputs:
+        print(f"擬合 {spec['name']}（target: {spec['target']}）...")
+        artifact = fit_glm_artifact(df, spec, sparse_inputs=sparse_inputs,
+                                    source=os.path.relpath(data_path, project_root))
+        output_file = os.path.join(script_dir, filename)
+        save_artifact(artifact, output_file)
+        print(f"  ✓ 係數數: {len(artifact['coefficients'])}，樣本數: {artifact['training']['n_obs']:,}")
+        for coef in artifact['coefficients'][:8]:
+            print(f"    {coef['name']:<40s} {coef['estimate']: .6f}")
+        if len(artifact['coefficients']) > 8:
+            print(f"    ...（其餘 {len(artifact['coefficients']) - 8} 個係數）")
+        print(f"  ✓ 已儲存至: {output_file}\n")
+
+    print("=" * 80)
+    print("模型 artifact 建立完成！")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
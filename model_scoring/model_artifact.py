@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型 artifact 格式
+目的：把在 R（或 Python）中擬合好的 binomial GLM 存成 JSON，
+讓新訂單不需重跑整份分析即可評分。
+
+artifact 內容：
+- family / link：目前支援 binomial(logit)
+- target：應變數名稱（如 success、is_bad_review）
+- derived：衍生變數（如 log_price = log1p(price)、類別對照表），依序計算
+- categoricals：類別變數的水準（第一個為參考組，treatment contrasts）
+- sparse_features：以 CSR 矩陣提供的多值特徵（如訂單內所有商品類別，
+  來源見 sql_merge/sparse_relations.py），記錄保留的欄名
+- coefficients：每個係數由若干 component 相乘而成
+    - 截距：components = []
+    - 數值變數：{"var": "log_price"}
+    - 類別水準：{"var": "product_category_name_english", "level": "baby"}
+    - 稀疏矩陣欄：{"var": "basket_categories", "column": "toys"}
+    - 交互作用：多個 component，例如 freight_value:delivery_gap
+
+含類別或稀疏特徵時，設計矩陣以 scipy.sparse CSR 建立，不展開成稠密的虛擬變數。
+"""
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+ARTIFACT_FORMAT_VERSION = 1
+
+# 稀疏設計矩陣計算標準誤時，每次以 LU 分解求解的單位向量數（記憶體約 p × 此數 × 8 bytes）
+INVERSE_DIAG_BLOCK = 256
+
+# 衍生變數可用的運算
+DERIVED_OPS = {'identity', 'log1p', 'log', 'gt', 'ge', 'lt', 'le', 'eq', 'map'}
+
+# 與 preprocessing.py / complete_analysis.R 相同的衍生變數定義
+DEFAULT_DERIVED = {
+    'log_price': {'op': 'log1p', 'source': 'price'},
+    'log_delivery_days': {'op': 'log1p', 'source': 'delivery_days'},
+    'delivery_delayed': {'op': 'gt', 'source': 'delivery_gap', 'value': 0},
+    'delivery_early': {'op': 'lt', 'source': 'delivery_gap', 'value': 0},
+}
+
+# 應變數定義（僅在 Python 端擬合時使用）
+TARGET_RULES = {
+    'success': {'op': 'eq', 'source': 'review_score', 'value': 5},
+    'is_bad_review': {'op': 'le', 'source': 'review_score', 'value': 4},
+}
+
+# complete_analysis.R 第六部分的 final_model
+FINAL_MODEL_SPEC = {
+    'name': 'final_model',
+    'target': 'success',
+    'terms': ['log_delivery_days', 'log_price', 'freight_value',
+              'delivery_delayed', 'delivery_early', 'freight_value:delivery_gap'],
+    'categoricals': {},
+    'derived': DEFAULT_DERIVED,
+}
+
+# 訂單內所有商品類別（multi-hot）對負評的影響，
+# 主類別模型 glm_b1 只看得到每單出現最多的類別
+BASKET_CATEGORY_SPEC = {
+    'name': 'basket_category_model',
+    'target': 'is_bad_review',
+    'terms': ['basket_categories'],
+    'categoricals': {},
+    'sparse_features': {
+        'basket_categories': {'relation': 'order_category', 'binary': True,
+                              'reference': 'books_general_interest', 'min_count': 1},
+    },
+    'derived': {},
+}
+
+# complete_analysis.R 階段五的 glm_b1
+BAD_REVIEW_CATEGORY_SPEC = {
+    'name': 'glm_b1',
+    'target': 'is_bad_review',
+    'terms': ['product_category_name_english'],
+    'categoricals': {'product_category_name_english': {'reference': 'books_general_interest'}},
+    'derived': {},
+}
+
+
+class ArtifactError(ValueError):
+    """artifact 格式錯誤"""
+
+
+# ============================================================================
+# 讀寫與檢查
+# ============================================================================
+
+def validate_artifact(artifact):
+    """檢查 artifact 結構，有問題時拋出 ArtifactError"""
+    if artifact.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        raise ArtifactError(f"不支援的 format_version: {artifact.get('format_version')}")
+    if (artifact.get('family'), artifact.get('link')) != ('binomial', 'logit'):
+        raise ArtifactError("目前僅支援 binomial(logit) 模型")
+    for name, spec in artifact.get('derived', {}).items():
+        if spec.get('op') not in DERIVED_OPS:
+            raise ArtifactError(f"衍生變數 {name} 使用未知運算: {spec.get('op')}")
+    categoricals = artifact.get('categoricals', {})
+    for var, spec in categoricals.items():
+        if not spec.get('levels'):
+            raise ArtifactError(f"類別變數 {var} 缺少 levels")
+    if not artifact.get('coefficients'):
+        raise ArtifactError("artifact 沒有任何係數")
+    sparse_features = artifact.get('sparse_features', {})
+    for var, spec in sparse_features.items():
+        if 'relation' not in spec or 'columns' not in spec:
+            raise ArtifactError(f"稀疏特徵 {var} 缺少 relation 或 columns")
+    for coef in artifact['coefficients']:
+        for comp in coef['components']:
+            if 'column' in comp:
+                if comp['var'] not in sparse_features:
+                    raise ArtifactError(f"係數 {coef['name']} 引用未宣告的稀疏特徵 {comp['var']}")
+                if comp['column'] not in sparse_features[comp['var']]['columns']:
+                    raise ArtifactError(f"係數 {coef['name']} 引用未知欄 {comp['column']}")
+            elif 'level' in comp:
+                if comp['var'] not in categoricals:
+                    raise ArtifactError(f"係數 {coef['name']} 引用未宣告的類別變數 {comp['var']}")
+                if comp['level'] not in categoricals[comp['var']]['levels']:
+                    raise ArtifactError(f"係數 {coef['name']} 引用未知水準 {comp['level']}")
+    return artifact
+
+
+def load_artifact(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return validate_artifact(json.load(f))
+
+
+def save_artifact(artifact, path):
+    validate_artifact(artifact)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def required_columns(artifact):
+    """評分時輸入資料需要提供的原始欄位（不含稀疏特徵）"""
+    derived = artifact.get('derived', {})
+    sparse_features = artifact.get('sparse_features', {})
+    needed = set()
+    for coef in artifact['coefficients']:
+        needed.update(comp['var'] for comp in coef['components']
+                      if comp['var'] not in sparse_features)
+    # 展開衍生變數的來源欄位
+    stack = list(needed)
+    while stack:
+        var = stack.pop()
+        if var in derived:
+            needed.discard(var)
+            source = derived[var]['source']
+            if source not in needed:
+                needed.add(source)
+                stack.append(source)
+    return sorted(needed)
+
+
+# ============================================================================
+# 特徵轉換
+# ============================================================================
+
+def _apply_op(spec, values):
+    op = spec['op']
+    if op == 'map':
+        mapped = values.map(spec['mapping'])
+        if spec.get('default') is not None:
+            mapped = mapped.fillna(spec['default'])
+        return mapped
+    x = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    if op == 'identity':
+        return x
+    if op == 'log1p':
+        return np.log1p(x)
+    if op == 'log':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.log(x)
+    threshold = spec['value']
+    with np.errstate(invalid='ignore'):
+        result = {'gt': x > threshold, 'ge': x >= threshold, 'lt': x < threshold,
+                  'le': x <= threshold, 'eq': x == threshold}[op].astype(float)
+    result[np.isnan(x)] = np.nan
+    return result
+
+
+def used_derived(derived, variables):
+    """只保留 variables（及其衍生來源）實際用到的衍生變數，維持原本順序"""
+    needed = set(variables)
+    for name in reversed(list(derived)):
+        if name in needed:
+            needed.add(derived[name]['source'])
+    return {name: spec for name, spec in derived.items() if name in needed}
+
+
+def derive_features(df, derived):
+    """依序計算衍生變數，回傳新的 DataFrame（不修改輸入）"""
+    if not derived:
+        return df
+    df = df.copy()
+    for name, spec in derived.items():
+        df[name] = _apply_op(spec, df[spec['source']])
+    return df
+
+
+# ============================================================================
+# Python 端擬合（與 R 的 glm(family = binomial) 相同估計量）
+# ============================================================================
+
+def _expand_terms(df, terms, categoricals, sparse_columns=None):
+    """把 R 風格的 term（含 a:b 交互作用）展開成係數 component 清單"""
+    sparse_columns = sparse_columns or {}
+    levels = {}
+    for var, spec in categoricals.items():
+        observed = sorted(df[var].dropna().astype(str).unique())
+        reference = spec.get('reference', observed[0] if observed else None)
+        if reference not in observed:
+            raise ArtifactError(f"參考組 {reference} 不在 {var} 的資料中")
+        levels[var] = [reference] + [lv for lv in observed if lv != reference]
+
+    coefficients = [{'name': '(Intercept)', 'components': []}]
+    for term in terms:
+        expanded = [([], '')]
+        for var in term.split(':'):
+            if var in sparse_columns:
+                expanded = [(comps + [{'var': var, 'column': col}],
+                             f"{prefix}{':' if prefix else ''}{var}{col}")
+                            for comps, prefix in expanded for col in sparse_columns[var]]
+            elif var in levels:
+                expanded = [(comps + [{'var': var, 'level': lv}],
+                             f"{prefix}{':' if prefix else ''}{var}{lv}")
+                            for comps, prefix in expanded for lv in levels[var][1:]]
+            else:
+                expanded = [(comps + [{'var': var}], f"{prefix}{':' if prefix else ''}{var}")
+                            for comps, prefix in expanded]
+        coefficients.extend({'name': name, 'components': comps} for comps, name in expanded)
+    return coefficients, levels
+
+
+def _weighted_gram(X, w):
+    """X' W X；X 為稀疏矩陣時結果也維持稀疏（CSC），不建立 p × p 稠密矩陣"""
+    if sparse.issparse(X):
+        X = sparse.csr_matrix(X)
+        return (X.T @ X.multiply(w[:, None])).tocsc()
+    return X.T @ (X * w[:, None])
+
+
+def _factorize(gram):
+    """
+    稀疏 X' W X 的 LU 分解。矩陣為對稱正定，使用對稱排序並固定取對角線為 pivot；
+    預設的 partial pivoting 在權重極小（完全分離）的欄會改選非對角 pivot，造成大量 fill-in。
+    """
+    try:
+        return splu(gram, permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.0,
+                    options={'SymmetricMode': True})
+    except RuntimeError as e:
+        raise ArtifactError("X' W X 為奇異矩陣（可能有完全共線的欄，"
+                            "稀疏特徵可提高 min_count 或指定 reference）") from e
+
+
+def _solve(gram, rhs):
+    if sparse.issparse(gram):
+        return _factorize(gram).solve(rhs)
+    return np.linalg.solve(gram, rhs)
+
+
+def _inverse_diagonal(gram):
+    """(X' W X)^-1 的對角線；稀疏時以 LU 分解分批求解，不計算完整反矩陣"""
+    if not sparse.issparse(gram):
+        return np.diag(np.linalg.inv(gram))
+    lu = _factorize(gram)
+    p = gram.shape[0]
+    diag = np.empty(p)
+    for start in range(0, p, INVERSE_DIAG_BLOCK):
+        idx = np.arange(start, min(p, start + INVERSE_DIAG_BLOCK))
+        unit = np.zeros((p, len(idx)))
+        unit[idx, np.arange(len(idx))] = 1.0
+        diag[idx] = lu.solve(unit)[idx, np.arange(len(idx))]
+    return diag
+
+
+def fit_logit_irls(X, y, max_iter=25, tol=1e-8):
+    """
+    以 IRLS 估計 binomial(logit) GLM，回傳係數與標準誤。
+    X 可為稠密或 CSR；CSR 時 X' W X 維持稀疏並以稀疏 LU 分解求解，
+    商品層級（order_product，數萬欄）也不需建立 p × p 稠密矩陣。
+    """
+    beta = np.zeros(X.shape[1])
+    for _ in range(max_iter):
+        eta = X @ beta
+        mu = 1.0 / (1.0 + np.exp(-eta))
+        w = np.clip(mu * (1.0 - mu), 1e-10, None)
+        z = eta + (y - mu) / w
+        new_beta = _solve(_weighted_gram(X, w), X.T @ (w * z))
+        converged = np.max(np.abs(new_beta - beta)) < tol
+        beta = new_beta
+        if converged:
+            break
+    return beta, np.sqrt(_inverse_diagonal(logit_information(X, beta)))
+
+
+def logit_information(X, beta):
+    """
+    係數 beta 下的 Fisher information X' W X（其反矩陣即係數共變異數矩陣）；
+    X 為稀疏矩陣時回傳稀疏矩陣
+    """
+    mu = 1.0 / (1.0 + np.exp(-(X @ beta)))
+    w = np.clip(mu * (1.0 - mu), 1e-10, None)
+    return _weighted_gram(X, w)
+
+
+def _finite_rows(X):
+    """每列是否所有值皆為有限數"""
+    if not sparse.issparse(X):
+        return np.isfinite(X).all(axis=1)
+    coo = X.tocoo()
+    ok = np.ones(X.shape[0], dtype=bool)
+    ok[coo.row[~np.isfinite(coo.data)]] = False
+    return ok
+
+
+def numeric_finite_rows(df, artifact):
+    """
+    所有數值 component 皆為有限數的列。
+    稀疏設計矩陣只存類別水準或稀疏欄相符的列，其他列的 NaN 不會出現在 X 中，
+    擬合與評分都需以此另外排除（評分時輸出 NaN，與稠密矩陣的結果相同）。
+    """
+    mask = np.ones(len(df), dtype=bool)
+    numeric_vars = {comp['var'] for coef in artifact['coefficients'] for comp in coef['components']
+                    if 'level' not in comp and 'column' not in comp}
+    for var in sorted(numeric_vars):
+        mask &= np.isfinite(pd.to_numeric(df[var], errors='coerce').to_numpy(dtype=float))
+    return mask
+
+
+def _sparse_columns(spec, matrix, vocab):
+    """訓練時保留的稀疏特徵欄：出現次數 >= min_count，且排除參考欄"""
+    counts = np.diff(matrix.tocsc().indptr)
+    min_count = spec.get('min_count', 1)
+    reference = spec.get('reference')
+    if reference is not None and reference not in vocab:
+        raise ArtifactError(f"參考欄 {reference} 不在稀疏特徵的欄名中")
+    return [col for col, n in zip(vocab, counts) if n >= min_count and col != reference]
+
+
+def fit_glm_artifact(df, spec, sparse_inputs=None, source=None):
+    """
+    依 spec 在 df 上擬合 logistic GLM 並回傳 artifact。
+    spec 含 sparse_features 時，sparse_inputs 需提供 {特徵名: (CSR 矩陣, 欄名 list)}，
+    矩陣的列與 df 對齊。
+    """
+    # 與 export_model_artifact.R 相同：只保留模型用到的衍生變數，
+    # 否則評分時會因缺少未使用的來源欄位而失敗
+    term_vars = {var for term in spec['terms'] for var in term.split(':')}
+    derived = used_derived(spec.get('derived', {}), term_vars)
+    target = spec['target']
+    data = derive_features(df, {**derived, target: TARGET_RULES[target]})
+
+    sparse_inputs = sparse_inputs or {}
+    sparse_specs = spec.get('sparse_features', {})
+    missing = [var for var in sparse_specs if var not in sparse_inputs]
+    if missing:
+        raise ArtifactError(f"缺少稀疏特徵輸入: {', '.join(missing)}")
+    sparse_columns = {var: _sparse_columns(sp, *sparse_inputs[var])
+                      for var, sp in sparse_specs.items()}
+
+    coefficients, levels = _expand_terms(data, spec['terms'], spec.get('categoricals', {}),
+                                         sparse_columns)
+    artifact = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'name': spec['name'],
+        'family': 'binomial',
+        'link': 'logit',
+        'target': target,
+        'derived': derived,
+        'categoricals': {var: {'levels': lv} for var, lv in levels.items()},
+        'coefficients': [dict(c, estimate=0.0) for c in coefficients],
+    }
+    if sparse_specs:
+        artifact['sparse_features'] = {
+            var: {'relation': sp['relation'], 'binary': sp.get('binary', False),
+                  'columns': sparse_columns[var]}
+            for var, sp in sparse_specs.items()
+        }
+
+    X = build_design_matrix(data, artifact, sparse_inputs)
+    y = data[target].to_numpy(dtype=float)
+    # 與 R 相同：類別變數或數值變數缺失的列不納入估計
+    mask = _finite_rows(X) & np.isfinite(y) & numeric_finite_rows(data, artifact)
+    for var in levels:
+        mask &= data[var].notna().to_numpy()
+    beta, std_error = fit_logit_irls(X[mask], y[mask])
+
+    for coef, est, se in zip(artifact['coefficients'], beta, std_error):
+        coef['estimate'] = float(est)
+        coef['std_error'] = float(se)
+    artifact['training'] = {
+        'n_obs': int(mask.sum()),
+        'source': source,
+        'fitted_by': 'python-irls',
+        'fitted_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    return artifact
+
+
+def _numeric(df, var, cache):
+    if var not in cache:
+        cache[var] = pd.to_numeric(df[var], errors='coerce').to_numpy(dtype=float)
+    return cache[var]
+
+
+def _intersect(rows, values, other_rows, other_values):
+    """兩個稀疏欄（已排序的列索引 + 值）逐元素相乘"""
+    if rows is None:
+        return other_rows, other_values
+    rows, i, k = np.intersect1d(rows, other_rows, assume_unique=True, return_indices=True)
+    return rows, values[i] * other_values[k]
+
+
+def _sparse_input_columns(artifact, sparse_inputs):
+    """把輸入矩陣的欄對應到 artifact 記錄的欄名，回傳 {var: {欄名: (列索引, 值)}}"""
+    columns = {}
+    for var, spec in artifact.get('sparse_features', {}).items():
+        if var not in sparse_inputs:
+            raise KeyError(var)
+        matrix, vocab = sparse_inputs[var]
+        csc = sparse.csc_matrix(matrix)
+        csc.sort_indices()
+        position = {name: k for k, name in enumerate(vocab)}
+        columns[var] = {}
+        for name in spec['columns']:
+            k = position.get(name)
+            if k is None:
+                # 輸入中沒有這個欄（例如新資料沒出現此類別）：整欄為 0
+                columns[var][name] = (np.empty(0, dtype=np.int64), np.empty(0))
+                continue
+            start, end = csc.indptr[k], csc.indptr[k + 1]
+            values = csc.data[start:end].astype(float)
+            if spec.get('binary', False):
+                values = (values > 0).astype(float)
+            columns[var][name] = (csc.indices[start:end].astype(np.int64), values)
+    return columns
+
+
+def build_design_matrix(df, artifact, sparse_inputs=None):
+    """
+    依 artifact 組成設計矩陣（df 需已含衍生變數）。
+    只有數值變數時回傳稠密矩陣；含類別水準或稀疏特徵時回傳 CSR，
+    每個係數欄只存非 0 的列，不展開成稠密的虛擬變數。
+    sparse_inputs：{特徵名: (CSR 矩陣, 欄名 list)}，列需與 df 對齊。
+    """
+    n = len(df)
+    coefficients = artifact['coefficients']
+    numeric_cache = {}
+    if not any('level' in comp or 'column' in comp
+               for coef in coefficients for comp in coef['components']):
+        X = np.ones((n, len(coefficients)))
+        for j, coef in enumerate(coefficients):
+            for comp in coef['components']:
+                X[:, j] *= _numeric(df, comp['var'], numeric_cache)
+        return X
+
+    # 類別變數：依 code 排序一次，每個水準的列即為排序後的一段
+    level_rows = {}
+    for var, spec in artifact.get('categoricals', {}).items():
+        codes = pd.Categorical(df[var].astype('string'), categories=spec['levels']).codes
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(spec['levels']) + 1))
+        level_rows[var] = {lv: np.sort(order[bounds[i]:bounds[i + 1]])
+                           for i, lv in enumerate(spec['levels'])}
+    sparse_columns = _sparse_input_columns(artifact, sparse_inputs or {})
+
+    all_rows, all_cols, all_values = [], [], []
+    for j, coef in enumerate(coefficients):
+        rows, values = None, None
+        for comp in coef['components']:
+            if 'level' in comp:
+                lv_rows = level_rows[comp['var']][comp['level']]
+                rows, values = _intersect(rows, values, lv_rows, np.ones(len(lv_rows)))
+            elif 'column' in comp:
+                rows, values = _intersect(rows, values, *sparse_columns[comp['var']][comp['column']])
+        for comp in coef['components']:
+            if 'level' not in comp and 'column' not in comp:
+                numeric = _numeric(df, comp['var'], numeric_cache)
+                if rows is None:
+                    rows, values = np.arange(n), np.ones(n)
+                values = values * numeric[rows]
+        if rows is None:  # 截距
+            rows, values = np.arange(n), np.ones(n)
+        all_rows.append(rows)
+        all_cols.append(np.full(len(rows), j))
+        all_values.append(values)
+    return sparse.csr_matrix(
+        (np.concatenate(all_values), (np.concatenate(all_rows), np.concatenate(all_cols))),
+        shape=(n, len(coefficients)),
+    )
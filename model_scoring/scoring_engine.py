@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+訂單評分引擎
+目的：以模型 artifact（見 model_artifact.py）對新訂單批次評分，
+在評論出現前標記可能給出負評的訂單。
+
+兩種模式：
+- batch：分批讀取 CSV（如 sql_merge/merged_olist_data.csv），輸出評分結果 CSV
+- serve：本機常駐 HTTP 服務，將同時到達的請求合併成 microbatch 一次評分
+
+每批資料只做一次矩陣乘法：X (n × p) @ beta (p)。
+模型含稀疏特徵（如訂單內所有商品類別）時，X 為 CSR 矩陣：
+batch 模式從 sql_merge/ 的 *_matrix.npz 依 order_id 對齊讀入；
+serve 模式由請求中的 list / dict 組成。
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from model_artifact import (build_design_matrix, derive_features, load_artifact,
+                            numeric_finite_rows, required_columns)
+
+# 依應變數換算「負評機率」
+BAD_REVIEW_PROB = {
+    'success': lambda p: 1.0 - p,
+    'is_bad_review': lambda p: p,
+}
+
+# batch 模式每批筆數
+CHUNK_SIZE = 200_000
+
+
+class ScoringEngine:
+    """載入 artifact 後對 DataFrame 向量化評分"""
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self.name = artifact['name']
+        self.target = artifact['target']
+        self.beta = np.array([c['estimate'] for c in artifact['coefficients']], dtype=float)
+        self.columns = required_columns(artifact)
+        self.sparse_features = artifact.get('sparse_features', {})
+        # serve 模式每筆訂單需提供的鍵（稀疏特徵以 list 或 {欄名: 數量} 表示）
+        self.record_columns = self.columns + list(self.sparse_features)
+        self._to_bad_review = BAD_REVIEW_PROB.get(self.target)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_artifact(path))
+
+    def _unknown_masks(self, data):
+        """各類別變數中不在訓練水準內（含缺失）的列"""
+        return {var: ~data[var].astype('string').isin(spec['levels']).to_numpy(dtype=bool)
+                for var, spec in self.artifact.get('categoricals', {}).items()}
+
+    def unknown_levels(self, df):
+        """各類別變數中不在訓練水準內（含缺失）的筆數，這些列不評分"""
+        return {var: int(mask.sum()) for var, mask in self._unknown_masks(self._prepare(df)).items()}
+
+    def _prepare(self, df):
+        missing = [c for c in self.columns if c not in df.columns]
+        if missing:
+            raise KeyError(f"輸入資料缺少欄位: {', '.join(missing)}")
+        return derive_features(df[self.columns], self.artifact.get('derived', {}))
+
+    def sparse_from_records(self, df):
+        """
+        由 df 中的稀疏特徵欄組成 CSR：每格為欄名 list（各計 1）或 {欄名: 數量}。
+        只保留 artifact 記錄的欄，其他欄名不影響評分。
+        回傳 (sparse_inputs, 缺失列)：值為 null 的列視為缺失，評分為 NaN；
+        其他型別拋出 TypeError（serve 模式回傳 400）。
+        """
+        inputs = {}
+        missing = np.zeros(len(df), dtype=bool)
+        for var, spec in self.sparse_features.items():
+            if var not in df.columns:
+                raise KeyError(var)
+            position = {name: k for k, name in enumerate(spec['columns'])}
+            rows, cols, values = [], [], []
+            for i, cell in enumerate(df[var].tolist()):
+                if cell is None or (isinstance(cell, float) and np.isnan(cell)):
+                    missing[i] = True
+                    continue
+                if isinstance(cell, dict):
+                    items = cell.items()
+                elif isinstance(cell, (list, tuple)):
+                    items = [(name, 1) for name in cell]
+                else:
+                    raise TypeError(f"{var} 需為欄名 list 或 {{欄名: 數量}}，收到 {type(cell).__name__}")
+                for name, n in items:
+                    if not isinstance(name, str):
+                        raise TypeError(f"{var} 的欄名需為字串，收到 {type(name).__name__}")
+                    if isinstance(n, bool) or not isinstance(n, (int, float)):
+                        raise TypeError(f"{var} 的數量需為數值，收到 {type(n).__name__}")
+                    k = position.get(name)
+                    if k is not None:
+                        rows.append(i)
+                        cols.append(k)
+                        values.append(float(n))
+            matrix = sparse.csr_matrix((values, (rows, cols)), shape=(len(df), len(position)))
+            matrix.sum_duplicates()
+            inputs[var] = (matrix, spec['columns'])
+        return inputs, missing
+
+    def score(self, df, sparse_inputs=None, missing=None):
+        """
+        回傳 target = 1 的預測機率（numpy 陣列，與 df 列順序相同）。
+        sparse_inputs：{特徵名: (CSR 矩陣, 欄名 list)}，列與 df 對齊；
+        未提供時由 df 中的稀疏特徵欄組成。
+        missing：布林陣列，True 的列缺少稀疏特徵，輸出 NaN。
+        """
+        if self.sparse_features and sparse_inputs is None:
+            sparse_inputs, missing = self.sparse_from_records(df)
+        data = self._prepare(df)
+        X = build_design_matrix(data, self.artifact, sparse_inputs)
+        eta = np.asarray(X @ self.beta, dtype=float)
+        # 數值變數缺失的列輸出 NaN（稀疏設計矩陣不會自動傳遞 NaN）
+        eta[~numeric_finite_rows(data, self.artifact)] = np.nan
+        # 模型沒看過的類別水準（含缺失）無法評分，回傳 NaN 而不是當作參考組
+        for mask in self._unknown_masks(data).values():
+            eta[mask] = np.nan
+        if missing is not None:
+            eta[missing] = np.nan
+        return 1.0 / (1.0 + np.exp(-eta))
+
+    def bad_review_prob(self, prob):
+        if self._to_bad_review is None:
+            return None
+        return self._to_bad_review(prob)
+
+
+# ============================================================================
+# batch 模式
+# ============================================================================
+
+def load_relations(engine, relations_dir):
+    """讀入模型需要的稀疏矩陣（整份只讀一次），回傳 {特徵名: (矩陣, 欄名, 列的 order_id)}"""
+    from sparse_relations import default_dir, load_order_ids, load_relation
+
+    relations_dir = relations_dir or default_dir
+    order_ids = pd.Index(load_order_ids(relations_dir))
+    return {var: (*load_relation(spec['relation'], directory=relations_dir), order_ids)
+            for var, spec in engine.sparse_features.items()}
+
+
+def score_file(engine, input_path, output_path, threshold=None, id_column='order_id',
+               chunk_size=CHUNK_SIZE, relations_dir=None):
+    """分批讀取輸入 CSV、評分並寫出結果"""
+    usecols = list(dict.fromkeys(
+        ([id_column] if id_column else []) + engine.columns
+    ))
+    header = pd.read_csv(input_path, nrows=0).columns
+    if id_column and id_column not in header:
+        usecols.remove(id_column)
+        id_column = None
+
+    relations = None
+    if engine.sparse_features:
+        from sparse_relations import align_rows
+
+        if not id_column:
+            raise KeyError("模型含稀疏特徵，輸入需有 order_id 欄位以對齊矩陣")
+        relations = load_relations(engine, relations_dir)
+
+    total = flagged = missing_orders = 0
+    unknown = {}
+    first = True
+    for chunk in pd.read_csv(input_path, usecols=usecols, chunksize=chunk_size,
+                             encoding='utf-8', low_memory=False):
+        sparse_inputs = missing = None
+        if relations is not None:
+            # 不在匯出矩陣中的訂單（例如尚未有評論的新訂單）不可當作空購物車評分
+            sparse_inputs = {}
+            missing = np.zeros(len(chunk), dtype=bool)
+            for var, (matrix, vocab, stored_ids) in relations.items():
+                aligned, found = align_rows(matrix, stored_ids, chunk[id_column])
+                sparse_inputs[var] = (aligned, vocab)
+                missing |= ~found
+            missing_orders += int(missing.sum())
+        prob = engine.score(chunk, sparse_inputs, missing)
+        out = pd.DataFrame(index=chunk.index)
+        if id_column:
+            out[id_column] = chunk[id_column]
+        out[f'prob_{engine.target}'] = prob
+        bad = engine.bad_review_prob(prob)
+        if bad is not None:
+            out['bad_review_prob'] = bad
+            if threshold is not None:
+                flag = pd.Series((bad >= threshold).astype(int), index=chunk.index).astype('Int64')
+                flag[np.isnan(bad)] = pd.NA
+                out['flag_bad_review'] = flag
+                flagged += int(flag.sum())
+        out.to_csv(output_path, mode='w' if first else 'a', header=first,
+                   index=False, encoding='utf-8')
+        first = False
+        total += len(chunk)
+        for var, n in engine.unknown_levels(chunk).items():
+            unknown[var] = unknown.get(var, 0) + n
+        print(f"  ✓ 已評分 {total:,} 筆")
+    return {'rows': total, 'flagged': flagged, 'unknown_levels': unknown,
+            'missing_orders': missing_orders}
+
+
+# ============================================================================
+# serve 模式（microbatching）
+# ============================================================================
+
+class MicroBatcher:
+    """把同時到達的請求合併成一批評分，降低每筆請求的平均延遲"""
+
+    def __init__(self, engine, max_batch_size=1024, max_wait_ms=5.0):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, records):
+        """送出一組訂單（list of dict），回傳 Future，結果為機率 list"""
+        # 合併成一批後缺少的鍵會被補成 NaN，因此在入列前逐筆檢查欄位
+        for record in records:
+            missing = [c for c in self.engine.record_columns if c not in record]
+            if missing:
+                raise KeyError(', '.join(missing))
+        future = Future()
+        self._queue.put((records, future))
+        return future
+
+    def close(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return []
+        batch, size = [item], len(item[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            records = [r for recs, _ in batch for r in recs]
+            try:
+                prob = self.engine.score(pd.DataFrame.from_records(records)) if records else np.empty(0)
+            except Exception:
+                # 合併後失敗時逐一評分，避免單一錯誤請求拖累同批的其他請求
+                for recs, future in batch:
+                    self._score_one(recs, future)
+                continue
+            offset = 0
+            for recs, future in batch:
+                future.set_result(prob[offset:offset + len(recs)].tolist())
+                offset += len(recs)
+
+    def _score_one(self, records, future):
+        try:
+            prob = self.engine.score(pd.DataFrame.from_records(records)) if records else np.empty(0)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(prob.tolist())
+
+
+class ScoringHTTPServer(ThreadingHTTPServer):
+    # 預設 listen backlog 只有 5，並發請求多時會被拒絕連線
+    request_queue_size = 256
+
+
+def _to_json_list(values):
+    """NaN（輸入值缺失）轉為 JSON null"""
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def make_handler(engine, batcher, timeout):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok', 'model': engine.name,
+                                      'target': engine.target, 'columns': engine.columns,
+                                      'sparse_features': list(engine.sparse_features)})
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/score':
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                records = payload['orders'] if isinstance(payload, dict) else payload
+                if isinstance(records, dict):
+                    records = [records]
+                prob = np.array(batcher.submit(records).result(timeout=timeout), dtype=float)
+            except KeyError as e:
+                self._send_json(400, {'error': f'缺少欄位: {e.args[0]}'})
+                return
+            except (ValueError, TypeError) as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            except FutureTimeoutError:
+                self._send_json(503, {'error': '評分逾時'})
+                return
+            result = {f'prob_{engine.target}': _to_json_list(prob)}
+            bad = engine.bad_review_prob(prob)
+            if bad is not None:
+                result['bad_review_prob'] = _to_json_list(bad)
+            self._send_json(200, result)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def serve(engine, host, port, max_batch_size, max_wait_ms, timeout=30.0):
+    batcher = MicroBatcher(engine, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server = ScoringHTTPServer((host, port), make_handler(engine, batcher, timeout))
+    print(f"✓ 評分服務啟動：http://{host}:{server.server_address[1]}")
+    print(f"  模型: {engine.name}（target: {engine.target}）")
+    print(f"  microbatch: 最多 {max_batch_size} 筆 / 最長等待 {max_wait_ms} ms")
+    print("  POST /score  {\"orders\": [{...}, ...]}")
+    print("  GET  /health")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止服務...")
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(script_dir)
+
+    parser = argparse.ArgumentParser(description='以模型 artifact 對訂單評分')
+    parser.add_argument('--model', default=os.path.join(script_dir, 'final_model.json'),
+                        help='模型 artifact 路徑（預設 model_scoring/final_model.json）')
+    sub = parser.add_subparsers(dest='mode', required=True)
+
+    p_batch = sub.add_parser('batch', help='對 CSV 檔案批次評分')
+    p_batch.add_argument('--input', default=os.path.join(project_root, 'sql_merge', 'merged_olist_data.csv'))
+    p_batch.add_argument('--output', default=os.path.join(script_dir, 'scored_orders.csv'))
+    p_batch.add_argument('--threshold', type=float, default=None,
+                         help='負評機率 >= threshold 時標記 flag_bad_review = 1')
+    p_batch.add_argument('--id-column', default='order_id')
+    p_batch.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    p_batch.add_argument('--relations-dir', default=os.path.join(project_root, 'sql_merge'),
+                         help='稀疏矩陣所在資料夾（模型含稀疏特徵時使用）')
+
+    p_serve = sub.add_parser('serve', help='啟動本機常駐評分服務')
+    p_serve.add_argument('--host', default='127.0.0.1')
+    p_serve.add_argument('--port', type=int, default=8765)
+    p_serve.add_argument('--max-batch-size', type=int, default=1024)
+    p_serve.add_argument('--max-wait-ms', type=float, default=5.0)
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"錯誤：找不到模型 artifact {args.model}")
+        print("請先執行 model_scoring/build_model_artifact.py 或由 complete_analysis.R 匯出！")
+        exit(1)
+    engine = ScoringEngine.from_file(args.model)
+    sys.path.insert(0, os.path.join(project_root, 'sql_merge'))
+
+    if args.mode == 'batch':
+        print("=" * 80)
+        print("訂單批次評分")
+        print("=" * 80)
+        print()
+        print(f"模型: {engine.name}（target: {engine.target}）")
+        print(f"輸入: {args.input}")
+        summary = score_file(engine, args.input, args.output, threshold=args.threshold,
+                             id_column=args.id_column, chunk_size=args.chunk_size,
+                             relations_dir=args.relations_dir)
+        print()
+        print(f"✓ 評分結果已儲存至: {args.output}")
+        print(f"  總筆數: {summary['rows']:,}")
+        if args.threshold is not None:
+            print(f"  標記為可能負評: {summary['flagged']:,}")
+        for var, n in summary['unknown_levels'].items():
+            if n:
+                print(f"  注意：{var} 有 {n:,} 筆不在訓練水準內，未評分（輸出為空值）")
+        if summary['missing_orders']:
+            print(f"  注意：{summary['missing_orders']:,} 筆訂單不在匯出的稀疏矩陣中，未評分（輸出為空值）")
+            print("        新訂單請改用 serve 模式傳入稀疏特徵，或重新匯出矩陣")
+    else:
+        serve(engine, args.host, args.port, args.max_batch_size, args.max_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
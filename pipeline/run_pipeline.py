@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pipeline 執行器（DAG + 內容定址快取）
+目的：取代手動依序執行 load_and_merge_data.py → preprocessing.py →
+create_binary_target.py。每個 stage 的快取 key 由以下內容的 SHA-256 組成：
+stage 程式碼、參數、所有輸入檔案內容。key 不變時直接沿用快取的輸出，
+只改動後段 stage 時不必重新合併資料。
+
+- 互不依賴的 stage（例如 non5 與 binary）以多個 worker 平行執行
+- 快取位於 .pipeline_cache/，超過容量上限時依最近使用時間（LRU）淘汰
+- 每個 stage 的輸出記錄在 .pipeline_cache/logs/<stage>.log
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from stages import STAGES
+
+# 快取 key 格式變更時請遞增
+CACHE_VERSION = 1
+
+DEFAULT_MAX_CACHE_GB = 5.0
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+cache_dir = os.path.join(project_root, '.pipeline_cache')
+objects_dir = os.path.join(cache_dir, 'objects')
+logs_dir = os.path.join(cache_dir, 'logs')
+
+
+class PipelineError(RuntimeError):
+    """stage 執行失敗或宣告錯誤"""
+
+
+# ============================================================================
+# 檔案雜湊（以 size + mtime 記憶，避免每次重讀大型 CSV）
+# ============================================================================
+
+class HashIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+
+    @staticmethod
+    def _digest(path, block_size=1 << 20):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def file_hash(self, path):
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        digest = self._digest(path)
+        with self._lock:
+            self._entries[path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def record(self, path, digest):
+        """已知內容雜湊時（例如從快取還原）直接登記"""
+        st = os.stat(path)
+        with self._lock:
+            self._entries[path] = [st.st_size, st.st_mtime_ns, digest]
+
+    def save(self):
+        with self._lock:
+            entries = {p: e for p, e in self._entries.items() if os.path.exists(p)}
+        _write_json(self.path, entries)
+
+
+def _write_json(path, obj):
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _abs(rel):
+    return os.path.join(project_root, rel)
+
+
+# ============================================================================
+# DAG
+# ============================================================================
+
+def build_dag(stages):
+    """由輸入/輸出檔案推導依賴關係，回傳 {stage: set(上游 stage)}"""
+    producers = {}
+    for name, spec in stages.items():
+        for out in spec['outputs']:
+            if out in producers:
+                raise PipelineError(f"{out} 同時由 {producers[out]} 與 {name} 產生")
+            producers[out] = name
+    deps = {name: {producers[i] for i in spec['inputs'] if i in producers}
+            for name, spec in stages.items()}
+
+    # 檢查循環依賴
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise PipelineError(f"stage 之間存在循環依賴：{name}")
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in stages:
+        visit(name)
+    return deps
+
+
+def select_stages(deps, targets):
+    """取得 targets 及其所有上游 stage"""
+    selected, stack = set(), list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(deps[name])
+    return selected
+
+
+# ============================================================================
+# 內容定址快取
+# ============================================================================
+
+class StageCache:
+    def __init__(self, max_bytes, hashes):
+        self.max_bytes = max_bytes
+        self.hashes = hashes
+        self._lock = threading.Lock()
+        self._pinned = set()
+        os.makedirs(objects_dir, exist_ok=True)
+
+    def stage_key(self, name, spec, known=None):
+        """known：{輸入路徑: 內容雜湊}，乾跑時以上游快取記錄的雜湊取代工作目錄中的檔案"""
+        known = known or {}
+        h = hashlib.sha256()
+        manifest = {
+            'cache_version': CACHE_VERSION,
+            'stage': name,
+            'python': sys.version.split()[0],
+            'args': spec['args'],
+            'params': spec['params'],
+            'code': {p: self.hashes.file_hash(_abs(p)) for p in [spec['script']] + spec['code']},
+            'inputs': {p: known[p] if p in known else self.hashes.file_hash(_abs(p))
+                       for p in spec['inputs']},
+            'outputs': spec['outputs'],
+        }
+        h.update(json.dumps(manifest, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(objects_dir, key)
+
+    def _meta_path(self, key):
+        return os.path.join(self._entry_dir(key), 'meta.json')
+
+    def lookup(self, key):
+        meta_path = self._meta_path(key)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def restore(self, key, meta):
+        """把快取中的輸出還原到工作目錄（內容已相同者略過）"""
+        with self._lock:
+            self._pinned.add(key)
+        restored = 0
+        for i, (rel, digest) in enumerate(meta['outputs']):
+            target = _abs(rel)
+            if os.path.exists(target) and self.hashes.file_hash(target) == digest:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f'{target}.restore.tmp'
+            shutil.copyfile(os.path.join(self._entry_dir(key), f'{i}.out'), tmp)
+            os.replace(tmp, target)
+            self.hashes.record(target, digest)
+            restored += 1
+        self.touch(key, meta)
+        return restored
+
+    def touch(self, key, meta):
+        meta['last_used'] = time.time()
+        _write_json(self._meta_path(key), meta)
+
+    def store(self, key, name, spec):
+        """把 stage 輸出複製進快取"""
+        final_dir = self._entry_dir(key)
+        tmp_dir = f'{final_dir}.{os.getpid()}.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        outputs, size = [], 0
+        for i, rel in enumerate(spec['outputs']):
+            src = _abs(rel)
+            shutil.copyfile(src, os.path.join(tmp_dir, f'{i}.out'))
+            outputs.append([rel, self.hashes.file_hash(src)])
+            size += os.path.getsize(src)
+        meta = {'stage': name, 'outputs': outputs, 'size': size,
+                'created': time.time(), 'last_used': time.time()}
+        _write_json(os.path.join(tmp_dir, 'meta.json'), meta)
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+        with self._lock:
+            self._pinned.add(key)
+        return meta
+
+    def evict(self):
+        """總容量超過上限時，依 last_used 由舊到新淘汰（本次執行用到的不淘汰）"""
+        entries = []
+        for key in os.listdir(objects_dir):
+            meta = self.lookup(key)
+            if meta is None:
+                # 中斷留下的暫存目錄
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                continue
+            entries.append((meta['last_used'], key, meta['size']))
+        total = sum(size for _, _, size in entries)
+        evicted = []
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+            evicted.append(key)
+        return evicted, total
+
+
+# ============================================================================
+# 執行
+# ============================================================================
+
+def run_stage(name, spec):
+    """以子行程執行 stage 腳本，輸出寫入 log 檔"""
+    log_path = os.path.join(logs_dir, f'{name}.log')
+    cmd = [sys.executable, _abs(spec['script'])] + spec['args']
+    env = dict(os.environ, PYTHONIOENCODING='utf-8')
+    start = time.time()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        result = subprocess.run(cmd, cwd=project_root, stdout=log,
+                                stderr=subprocess.STDOUT, env=env)
+    elapsed = time.time() - start
+    if result.returncode != 0:
+        raise PipelineError(f"{name} 執行失敗（exit code {result.returncode}），請查看 {log_path}")
+    missing = [rel for rel in spec['outputs'] if not os.path.exists(_abs(rel))]
+    if missing:
+        raise PipelineError(f"{name} 未產生輸出：{', '.join(missing)}，請查看 {log_path}")
+    return elapsed
+
+
+def _outputs_current(cache, meta):
+    """工作目錄中的輸出是否與快取內容相同"""
+    return all(os.path.exists(_abs(rel)) and cache.hashes.file_hash(_abs(rel)) == digest
+               for rel, digest in meta['outputs'])
+
+
+def process_stage(name, spec, cache, force, dry_run, known=None):
+    """回傳 (狀態, 快取 key, 執行秒數, 快取 meta)"""
+    known = known or {}
+    missing = [rel for rel in spec['inputs'] if rel not in known and not os.path.exists(_abs(rel))]
+    if missing:
+        raise PipelineError(f"{name} 缺少輸入：{', '.join(missing)}")
+    key = cache.stage_key(name, spec, known)
+    meta = None if force else cache.lookup(key)
+    if meta is not None:
+        if dry_run:
+            return ('cached' if _outputs_current(cache, meta) else 'restore'), key, 0.0, meta
+        restored = cache.restore(key, meta)
+        return ('restored' if restored else 'cached'), key, 0.0, meta
+    if dry_run:
+        return 'run', key, 0.0, None
+    elapsed = run_stage(name, spec)
+    meta = cache.store(key, name, spec)
+    return 'ran', key, elapsed, meta
+
+
+def execute(stages, targets, jobs, force, dry_run, max_bytes):
+    deps = build_dag(stages)
+    selected = select_stages(deps, targets)
+    hashes = HashIndex(os.path.join(cache_dir, 'hash_index.json'))
+    cache = StageCache(max_bytes, hashes)
+
+    pending = {name for name in selected}
+    done, failed = set(), set()
+    # 乾跑時不還原檔案，下游的輸入雜湊改用上游快取記錄的輸出雜湊
+    known = {}
+    status = {}
+    futures = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or futures:
+            # 上游完成的 stage 送出執行；上游失敗者標記為略過
+            for name in sorted(pending):
+                upstream = deps[name] & selected
+                if upstream & failed:
+                    pending.discard(name)
+                    failed.add(name)
+                    status[name] = 'skipped'
+                    print(f"  - {name:<16s} 略過（上游失敗）")
+                elif upstream <= done:
+                    pending.discard(name)
+                    # --force 只重跑使用者指定的 targets，上游仍可沿用快取
+                    futures[pool.submit(process_stage, name, stages[name], cache,
+                                        force and name in targets, dry_run, dict(known))] = name
+                    if not dry_run:
+                        print(f"  … {name:<16s} 處理中")
+            if not futures:
+                break
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = futures.pop(future)
+                try:
+                    state, key, elapsed, meta = future.result()
+                except Exception as e:
+                    # 任何錯誤都只讓此 stage 失敗，其他 stage 繼續，下游標記為略過
+                    failed.add(name)
+                    status[name] = 'failed'
+                    message = str(e) if isinstance(e, PipelineError) else f'{type(e).__name__}: {e}'
+                    print(f"  ✗ {name:<16s} {message}")
+                    continue
+                if dry_run and meta is not None:
+                    known.update((rel, digest) for rel, digest in meta['outputs'])
+                done.add(name)
+                status[name] = state
+                label = {'ran': f'已執行（{elapsed:.1f} 秒）',
+                         'restored': '快取命中，已還原輸出',
+                         'cached': '快取命中，輸出未改變',
+                         'restore': '快取命中，將還原輸出',
+                         'run': '需要執行'}[state]
+                print(f"  ✓ {name:<16s} {label}  [{key[:12]}]")
+                if dry_run:
+                    # 乾跑時上游若需執行，下游 key 無法預先得知
+                    if state == 'run':
+                        for other in selected:
+                            if name in deps[other]:
+                                pending.discard(other)
+                                status[other] = 'pending'
+                                print(f"  ? {other:<16s} 待上游執行後決定")
+
+    hashes.save()
+    if not dry_run:
+        evicted, total = cache.evict()
+        print(f"\n快取大小: {total / 1e6:,.1f} MB（上限 {max_bytes / 1e6:,.0f} MB）")
+        if evicted:
+            print(f"  已淘汰 {len(evicted)} 筆最久未使用的快取")
+    return status, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='執行資料處理 pipeline（含快取）')
+    parser.add_argument('targets', nargs='*', default=None,
+                        help=f"要產生的 stage（預設全部）：{', '.join(STAGES)}")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='平行執行的 stage 數')
+    parser.add_argument('--force', action='store_true',
+                        help='忽略快取，重新執行指定的 targets')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='只列出各 stage 是否命中快取，不實際執行')
+    parser.add_argument('--max-cache-gb', type=float, default=DEFAULT_MAX_CACHE_GB,
+                        help=f'快取容量上限（GB，預設 {DEFAULT_MAX_CACHE_GB}）')
+    args = parser.parse_args()
+
+    targets = args.targets or list(STAGES)
+    unknown = [t for t in targets if t not in STAGES]
+    if unknown:
+        parser.error(f"未知的 stage：{', '.join(unknown)}")
+
+    print("=" * 80)
+    print("執行資料處理 pipeline")
+    print("=" * 80)
+    print()
+
+    os.makedirs(logs_dir, exist_ok=True)
+    try:
+        status, failed = execute(STAGES, targets, args.jobs, args.force, args.dry_run,
+                                 int(args.max_cache_gb * 1e9))
+    except PipelineError as e:
+        print(f"錯誤：{e}")
+        sys.exit(1)
+
+    print()
+    print("=" * 80)
+    if failed:
+        print(f"pipeline 未完成：{', '.join(sorted(failed))}")
+        print("=" * 80)
+        sys.exit(1)
+    print("pipeline 完成！")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+pipeline 各階段（stage）宣告
+每個 stage 宣告：
+- script  ：執行的 Python 腳本（相對於專案根目錄）
+- args    ：傳給腳本的參數
+- code    ：除 script 之外、會影響輸出的程式碼或 SQL 檔
+- inputs  ：輸入檔案；若為其他 stage 的輸出，即自動形成依賴關係（DAG）
+- outputs ：輸出檔案（會被存入快取）
+- params  ：其他影響輸出的參數（納入快取 key）
+"""
+
+CSV_FILES = [
+    'olist_customers_dataset.csv',
+    'olist_orders_dataset.csv',
+    'olist_order_items_dataset.csv',
+    'olist_order_payments_dataset.csv',
+    'olist_order_reviews_dataset.csv',
+    'olist_products_dataset.csv',
+    'olist_sellers_dataset.csv',
+    'product_category_name_translation.csv',
+]
+
+STAGES = {
+    'merge': {
+        'script': 'sql_merge/load_and_merge_data.py',
+        'args': [],
+        'code': ['sql_merge/merge_data.sql', 'sql_merge/sparse_relations.py'],
+        'inputs': [f'csv/{name}' for name in CSV_FILES],
+        'outputs': ['sql_merge/merged_olist_data.csv',
+                    'sql_merge/sparse_order_ids.txt',
+                    'sql_merge/order_product_matrix.npz',
+                    'sql_merge/order_product_vocab.txt',
+                    'sql_merge/order_category_matrix.npz',
+                    'sql_merge/order_category_vocab.txt'],
+        'params': {},
+    },
+    'preprocess': {
+        'script': 'data_preprocessing/preprocessing.py',
+        # 非滿分子集改由 non5 stage 產生，才能與 binary 平行
+        'args': ['--no-non5'],
+        'code': [],
+        'inputs': ['sql_merge/merged_olist_data.csv'],
+        'outputs': ['data_preprocessing/preprocessed_data.csv'],
+        'params': {},
+    },
+    'non5': {
+        'script': 'data_preprocessing/create_non5_subset.py',
+        'args': [],
+        'code': [],
+        'inputs': ['data_preprocessing/preprocessed_data.csv'],
+        'outputs': ['data_preprocessing/preprocessed_data_non5.csv'],
+        'params': {},
+    },
+    'binary': {
+        'script': 'data_preprocessing/create_binary_target.py',
+        'args': [],
+        'code': [],
+        'inputs': ['data_preprocessing/preprocessed_data.csv'],
+        'outputs': ['data_preprocessing/preprocessed_data_binary.csv'],
+        'params': {},
+    },
+    'model_artifact': {
+        'script': 'model_scoring/build_model_artifact.py',
+        'args': [],
+        'code': ['model_scoring/model_artifact.py', 'sql_merge/sparse_relations.py'],
+        'inputs': ['data_preprocessing/preprocessed_data.csv',
+                   'sql_merge/sparse_order_ids.txt',
+                   'sql_merge/order_category_matrix.npz',
+                   'sql_merge/order_category_vocab.txt'],
+        'outputs': ['model_scoring/final_model.json',
+                    'model_scoring/bad_review_category_model.json',
+                    'model_scoring/bad_review_basket_model.json'],
+        'params': {},
+    },
+}
@@ -8,6 +8,8 @@ import pandas as pd
 import os
 from datetime import datetime
 
+from sparse_relations import export_sparse_relations
+
 def load_csv_to_database():
     """將所有 CSV 檔案載入 SQLite 資料庫"""
     
@@ -155,6 +157,14 @@ def export_merged_data(conn):
     
     return df_merged
 
+def export_sparse_matrices(conn, df_merged):
+    """匯出訂單 × 商品、訂單 × 類別的 CSR 稀疏矩陣（列順序與 merged_olist_data.csv 相同）"""
+    
+    print("\n匯出稀疏矩陣...")
+    shapes = export_sparse_relations(conn, df_merged['order_id'])
+    for name, (shape, nnz) in shapes.items():
+        print(f"  ✓ {name}_matrix.npz: {shape[0]:,} 訂單 × {shape[1]:,} 欄，非零元素 {nnz:,}")
+
 def main():
     """主程式"""
     print("=" * 60)
@@ -173,6 +183,9 @@ def main():
     # 匯出合併後的資料
     df_merged = export_merged_data(conn)
     
+    # 匯出稀疏矩陣（取代逐列拆解 product_ids / product_categories 字串）
+    export_sparse_matrices(conn, df_merged)
+    
     # 關閉資料庫連線
     conn.close()
     
@@ -0,0 +1,132 @@
+"""
+訂單 × 商品、訂單 × 類別稀疏矩陣（CSR）
+merged_olist_data 中的 product_ids / product_categories 是以逗號串接的字串，
+下游使用時必須逐列拆字串，且類別虛擬變數會被展開成稠密矩陣。
+此模組直接從 SQLite 資料庫取出訂單與商品/類別的關係，存成壓縮的 CSR 矩陣：
+
+- 列（row）：與 merged_olist_data.csv 的列順序相同（order_id 另存一份供對齊）
+- 欄（column）：排序後的商品 ID / 英文類別名稱（相同資料必得相同欄順序）
+- 值：該訂單中此商品 / 此類別的品項數（num_items 的拆分）
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+RELATIONS = {
+    'order_product': {
+        'column': 'product_id',
+        'query': """
+            SELECT oi.order_id, oi.product_id AS item, COUNT(*) AS n
+            FROM olist_order_items_dataset oi
+            GROUP BY oi.order_id, oi.product_id
+        """,
+    },
+    'order_category': {
+        'column': 'product_category_name_english',
+        # 與 merge_data.sql 的 product_categories 相同：沒有英文翻譯的類別不列入
+        'query': """
+            SELECT oi.order_id, pc.product_category_name_english AS item, COUNT(*) AS n
+            FROM olist_order_items_dataset oi
+            LEFT JOIN olist_products_dataset p ON oi.product_id = p.product_id
+            LEFT JOIN product_category_name_translation pc
+              ON p.product_category_name = pc.product_category_name
+            WHERE pc.product_category_name_english IS NOT NULL
+            GROUP BY oi.order_id, pc.product_category_name_english
+        """,
+    },
+}
+
+ORDER_IDS_FILE = 'sparse_order_ids.txt'
+
+default_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def matrix_path(name, directory=default_dir):
+    return os.path.join(directory, f'{name}_matrix.npz')
+
+
+def vocab_path(name, directory=default_dir):
+    return os.path.join(directory, f'{name}_vocab.txt')
+
+
+def _write_lines(path, values):
+    with open(path, 'w', encoding='utf-8') as f:
+        for value in values:
+            f.write(f'{value}\n')
+
+
+def _read_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def build_relation(pairs, order_ids):
+    """
+    由 (order_id, item, n) 建立 CSR；列依 order_ids 排列，欄為排序後的 item。
+    order_ids 可重複（merged_olist_data 中評論日期並列的訂單會出現多列），
+    重複的訂單各自得到相同的列。
+    """
+    rows = pd.DataFrame({'order_id': pd.Series(order_ids, dtype=str).to_numpy(),
+                         'row': np.arange(len(order_ids))})
+    pairs = pairs.astype({'order_id': str}).merge(rows, on='order_id', how='inner')
+    vocab, cols = np.unique(pairs['item'].astype(str).to_numpy(), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (pairs['n'].to_numpy(dtype=np.float64), (pairs['row'].to_numpy(), cols)),
+        shape=(len(rows), len(vocab)),
+    )
+    matrix.sum_duplicates()
+    return matrix, list(vocab)
+
+
+def export_sparse_relations(conn, order_ids, directory=default_dir):
+    """查詢 SQLite 並輸出所有稀疏矩陣與欄名表，回傳 {名稱: 矩陣形狀}"""
+    order_ids = pd.Series(order_ids).astype(str).to_list()
+    shapes = {}
+    for name, spec in RELATIONS.items():
+        pairs = pd.read_sql_query(spec['query'], conn)
+        matrix, vocab = build_relation(pairs, order_ids)
+        sparse.save_npz(matrix_path(name, directory), matrix, compressed=True)
+        _write_lines(vocab_path(name, directory), vocab)
+        shapes[name] = (matrix.shape, matrix.nnz)
+    _write_lines(os.path.join(directory, ORDER_IDS_FILE), order_ids)
+    return shapes
+
+
+def load_order_ids(directory=default_dir):
+    """矩陣各列對應的 order_id"""
+    return _read_lines(os.path.join(directory, ORDER_IDS_FILE))
+
+
+def align_rows(matrix, stored_ids, order_ids):
+    """
+    依 order_ids 的順序重新排列 matrix 的列（stored_ids 為 matrix 目前的列順序）。
+    以選取矩陣相乘，不需轉成稠密矩陣。回傳 (CSR 矩陣, found)：
+    found 為布林陣列，找不到的訂單為 False（矩陣中為全 0 列，不代表空購物車）。
+    """
+    stored_ids = pd.Index(stored_ids)
+    # 重複的訂單內容相同，取第一次出現的列
+    first = ~stored_ids.duplicated(keep='first')
+    positions = np.flatnonzero(first)
+    lookup = stored_ids[first].get_indexer(pd.Series(order_ids).astype(str))
+    rows = np.where(lookup >= 0, positions[lookup], -1)
+    found = rows >= 0
+    selector = sparse.csr_matrix(
+        (np.ones(found.sum()), (np.flatnonzero(found), rows[found])),
+        shape=(len(rows), matrix.shape[0]),
+    )
+    return (selector @ matrix).tocsr(), found
+
+
+def load_relation(name, order_ids=None, directory=default_dir):
+    """
+    讀取稀疏矩陣，回傳 (CSR 矩陣, 欄名 list)。
+    指定 order_ids 時，依其順序重新排列列（例如對齊前處理後的資料）。
+    """
+    matrix = sparse.load_npz(matrix_path(name, directory)).tocsr()
+    vocab = _read_lines(vocab_path(name, directory))
+    if order_ids is not None:
+        matrix, _ = align_rows(matrix, load_order_ids(directory), order_ids)
+    return matrix, vocab